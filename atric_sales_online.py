@@ -9,35 +9,71 @@ Atric Sales Assistant (Online)
 - Ready for Streamlit Cloud deployment
 """
 
+import asyncio
+import io
 import re
+import aiohttp
+import numpy as np
 import pandas as pd
 import streamlit as st
 
+try:  # optional: Arrow's C++ CSV writer for downloads (pyarrow ships with Streamlit)
+    import pyarrow as pa
+    import pyarrow.csv as pac
+except ImportError:
+    pa = None
+
 st.set_page_config(page_title="Atric Sales Assistant (Online)", layout="wide")
 
 # ====== CONFIG: put your Google Sheet ID here ======
 SHEET_ID = "1z3thCqp7QA-4Bq7Kn6zc5ptPGLYXUYwdGMu6Atncs-w"
 SHEETS = ["Boardwalk", "BOHO"]  # sheet/tab names inside Google Sheets
 REFRESH_SECONDS = 90            # cache TTL (seconds) for auto-refresh
+FETCH_TIMEOUT = 20              # per-request timeout (seconds) for sheet downloads
+FETCH_RETRIES = 2               # extra attempts per sheet before giving up
+MAX_UNIT_CHOICES = 500          # cap on units listed in the preview dropdown
 # ====================================================
 
 def csv_export_url(sheet_name: str) -> str:
     # Use the gviz CSV export for public sheets
     return f"https://docs.google.com/spreadsheets/d/{SHEET_ID}/gviz/tq?tqx=out:csv&sheet={sheet_name}"
 
+async def _fetch_csv(session: aiohttp.ClientSession, url: str) -> bytes:
+    async def _get() -> bytes:
+        async with session.get(url) as resp:
+            resp.raise_for_status()
+            return await resp.read()
+    for attempt in range(FETCH_RETRIES + 1):
+        try:
+            return await asyncio.wait_for(_get(), timeout=FETCH_TIMEOUT)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if attempt == FETCH_RETRIES:
+                raise
+            await asyncio.sleep(0.5 * (attempt + 1))
+
+async def _fetch_all(sheet_names: list) -> dict:
+    """Download all sheet CSVs concurrently; returns {sheet_name: raw bytes}."""
+    async with aiohttp.ClientSession() as session:
+        blobs = await asyncio.gather(*(_fetch_csv(session, csv_export_url(n)) for n in sheet_names))
+    return dict(zip(sheet_names, blobs))
+
 def coerce_numeric(series: pd.Series) -> pd.Series:
-    return pd.to_numeric(series.astype(str).str.replace(",", "").str.strip(), errors="coerce")
+    # One regex pass strips thousands separators and whitespace
+    s = series.astype("string").str.replace(r"[,\s]", "", regex=True)
+    return pd.to_numeric(s, errors="coerce").astype("Float64")
 
 def cleanup_cols(df: pd.DataFrame) -> pd.DataFrame:
-    # Normalize object columns
-    for c in df.select_dtypes(include=["object"]).columns:
-        df[c] = df[c].astype(str).str.strip()
-        df[c] = df[c].replace({"nan": pd.NA})
+    # Normalize text columns (object from the C engine, Arrow strings from pyarrow)
+    for c in df.select_dtypes(include=["object", "string"]).columns:
+        s = df[c].astype(str) if df[c].dtype == object else df[c]
+        df[c] = s.str.strip().replace({"nan": pd.NA})
     # Normalize fields
     if "floor" in df.columns:
         df["floor"] = df["floor"].str.replace(r"\s+", " ", regex=True)
     if "configuration" in df.columns:
         df["configuration"] = df["configuration"].str.replace(r"\s+", " ", regex=True)
+        # Bedroom count parsed once so filters compare integers instead of regex-matching text
+        df["_bedrooms"] = df["configuration"].str.extract(r"(?i)(?:^|\s)(?P<n>\d{1,4})\s*Bedrooms?", expand=False).astype("Int16")
     # Convert numerics
     for num_col in ["price", "selling_area", "land_area", "garden_area", "terrace_area"]:
         if num_col in df.columns:
@@ -77,13 +113,37 @@ BOHO_KEEP = {
 EXPECTED_BW_HEADERS = set(BW_KEEP.keys())
 EXPECTED_BOHO_HEADERS = set(BOHO_KEEP.keys())
 
-def try_load_sheet(url: str) -> pd.DataFrame:
+# Column order of the combined table (remaining columns follow alphabetically)
+KEY_ORDER = [
+    "project", "building", "unit_no", "floor", "configuration", "unit_type",
+    "selling_area", "land_area", "garden_area", "terrace_area", "price", "status"
+]
+
+def stack_column(frames: list, col: str) -> pd.Series:
+    """Concatenate one column across frames, NA-filling frames that lack it (keeps the column's dtype)."""
+    dtype = next(df[col].dtype for df in frames if col in df.columns)
+    parts = [df[col] if col in df.columns else pd.Series(index=df.index, dtype=dtype) for df in frames]
+    return pd.concat(parts, ignore_index=True)
+
+def read_csv_bytes(data: bytes, **kwargs) -> pd.DataFrame:
+    """Parse with pyarrow's multithreaded reader into Arrow-backed columns; fall back to the C engine."""
+    try:
+        df = pd.read_csv(io.BytesIO(data), engine="pyarrow", dtype_backend="pyarrow", **kwargs)
+    except (ImportError, ValueError):
+        return pd.read_csv(io.BytesIO(data), **kwargs)
+    # An entirely blank column comes back as null[pyarrow], which has no .str accessor
+    blank = df.dtypes == "null[pyarrow]"
+    if blank.any():
+        df = df.astype({c: "string[pyarrow]" for c in df.columns[blank.to_numpy()]})
+    return df
+
+def try_load_sheet(data: bytes) -> pd.DataFrame:
     """Try header row at index 0 first; if it doesn't match, try Excel-style header at row 1."""
-    df0 = pd.read_csv(url)
+    df0 = read_csv_bytes(data)
     if len(set(df0.columns) & (EXPECTED_BW_HEADERS | EXPECTED_BOHO_HEADERS)) >= 4:
         return df0
     # Otherwise, try header at row 1 (like your Excel pattern)
-    raw = pd.read_csv(url, header=None)
+    raw = read_csv_bytes(data, header=None)
     if len(raw) >= 2:
         header = raw.iloc[1].tolist()
         df = raw.iloc[2:].copy()
@@ -93,42 +153,62 @@ def try_load_sheet(url: str) -> pd.DataFrame:
 
 @st.cache_data(ttl=REFRESH_SECONDS, show_spinner=False)
 def load_all_units() -> pd.DataFrame:
-    # Load both sheets
-    bw_raw = try_load_sheet(csv_export_url("Boardwalk"))
-    boho_raw = try_load_sheet(csv_export_url("BOHO"))
-
-    # Keep/rename important columns
-    bw = bw_raw[[c for c in BW_KEEP if c in bw_raw.columns]].rename(columns=BW_KEEP)
+    # Load both sheets (downloaded in parallel)
+    raw = asyncio.run(_fetch_all(SHEETS))
+    bw_raw = try_load_sheet(raw["Boardwalk"])
+    boho_raw = try_load_sheet(raw["BOHO"])
+
+    # Keep/rename important columns; blank sheet rows are dropped per sheet here,
+    # so the combined table needs no dropna pass
+    bw = bw_raw[[c for c in BW_KEEP if c in bw_raw.columns]]
+    bw = bw[bw.notna().any(axis=1)].rename(columns=BW_KEEP)
     bw["project"] = "Boardwalk"
-    boho = boho_raw[[c for c in BOHO_KEEP if c in boho_raw.columns]].rename(columns=BOHO_KEEP)
+    boho = boho_raw[[c for c in BOHO_KEEP if c in boho_raw.columns]]
+    boho = boho[boho.notna().any(axis=1)].rename(columns=BOHO_KEEP)
     boho["project"] = "BOHO"
 
     # Clean
     bw, boho = cleanup_cols(bw), cleanup_cols(boho)
 
-    # Harmonize & concat
-    all_cols = sorted(set(bw.columns).union(set(boho.columns)))
-    bw, boho = bw.reindex(columns=all_cols), boho.reindex(columns=all_cols)
-    units = pd.concat([bw, boho], ignore_index=True).dropna(how="all")
-
-    # Column order
-    key_order = [
-        "project", "building", "unit_no", "floor", "configuration", "unit_type",
-        "selling_area", "land_area", "garden_area", "terrace_area", "price", "status"
-    ]
-    ordered = key_order + [c for c in units.columns if c not in key_order]
-    units = units.reindex(columns=[c for c in ordered if c in units.columns])
-
-    # Add lowercase helper columns (not shown) for matching
-    units["_unit_upper"] = units["unit_no"].astype(str).str.upper()
-    units["_building_upper"] = units["building"].astype(str).str.upper()
+    # Harmonize & concat column by column, already in display order (no whole-frame reindex)
+    present = set(bw.columns) | set(boho.columns)
+    all_cols = [c for c in KEY_ORDER if c in present] + sorted(present - set(KEY_ORDER))
+    units = pd.DataFrame({c: stack_column([bw, boho], c) for c in all_cols}, copy=False)
+
+    # Add lowercase helper columns (not shown) for matching; categorical, so .cat.categories
+    # doubles as the set of known codes used to validate chat queries
+    units["_unit_upper"] = units["unit_no"].astype(str).str.upper().astype("category")
+    units["_building_upper"] = units["building"].astype(str).str.upper().astype("category")
+    # NaN-filled numeric helpers as plain NumPy float columns, so filters skip fillna on every rerun
+    units["_price_f"] = units["price"].fillna(0).to_numpy(dtype="float64")
+    units["_area_f"] = units["selling_area"].fillna(0).to_numpy(dtype="float64")
+
+    # Low-cardinality text columns as categories: smaller cache, integer-code isin
+    for c in ("project", "status", "building", "configuration", "unit_type", "floor"):
+        if c in units.columns:
+            units[c] = units[c].astype("category")
     return units
 
+# Query patterns, compiled once at import (Streamlit reruns the script on every keystroke)
+_RE_NUMBER = re.compile(r"(\d+(?:\.\d+)?)([mk])?")
+# Bedrooms, price bounds and area bounds share one alternation so the prompt is scanned once;
+# the outer named group of each branch is what m.lastgroup reports
+_RE_QUERY = re.compile(
+    r"(?P<amin>(?:area|sqm)\s*(?:>=|over|min)\s*(?P<amin_n>[\d\.,]+))"
+    r"|(?P<amax>(?:area|sqm)\s*(?:<=|under|max)\s*(?P<amax_n>[\d\.,]+))"
+    r"|(?P<under>(?:under|<=|less than)\s*(?P<under_n>[\d\.,]+)\s*(?P<under_u>[mk])?)"
+    r"|(?P<over>(?:over|>=|more than|above)\s*(?P<over_n>[\d\.,]+)\s*(?P<over_u>[mk])?)"
+    r"|(?P<bed>(?P<bed_n>\d+)\s*(?:bed|bedroom|bedrooms))"
+)
+_RE_PLAIN_NUM = re.compile(r"\b(\d{2,4})\b")
+_RE_BUILDING = re.compile(r"\b([a-z]\d{1,2})\b", re.IGNORECASE)
+_RE_UNIT = re.compile(r"\b([a-z]\d{1,2}-\d{2,3})\b", re.IGNORECASE)
+
 def parse_number(s: str):
     if not s:
         return None
     s = str(s).strip().lower().replace(",", "")
-    m = re.fullmatch(r"(\d+(?:\.\d+)?)([mk])?", s)
+    m = _RE_NUMBER.fullmatch(s)
     if not m:
         try:
             return float(s)
@@ -150,50 +230,80 @@ def parse_query(q: str):
     # status
     if "available" in ql: f["status"] = ["Available"]
     if "hold" in ql: f["status"] = ["Hold"]
-    # bedrooms
-    m = re.search(r"(\d+)\s*(bed|bedroom|bedrooms)", ql)
-    if m: f["bedrooms"] = m.group(1)
-    # price
-    m = re.search(r"(under|<=|less than)\s*([\d\.,]+)\s*([mk])?", ql)
-    if m:
-        val = float(m.group(2).replace(",", "")); unit = m.group(3) or ""
-        f["max_price"] = val * (1_000_000 if unit == "m" else 1_000 if unit == "k" else 1)
-    m = re.search(r"(over|>=|more than|above)\s*([\d\.,]+)\s*([mk])?", ql)
-    if m:
-        val = float(m.group(2).replace(",", "")); unit = m.group(3) or ""
-        f["min_price"] = val * (1_000_000 if unit == "m" else 1_000 if unit == "k" else 1)
-    # area range
-    m = re.search(r"(area|sqm)\s*(>=|over|min)\s*([\d\.,]+)", ql)
-    if m: f["min_area"] = float(m.group(3).replace(",", ""))
-    m = re.search(r"(area|sqm)\s*(<=|under|max)\s*([\d\.,]+)", ql)
-    if m: f["max_area"] = float(m.group(3).replace(",", ""))
+    # bedrooms, price and area range (first occurrence of each wins)
+    for m in _RE_QUERY.finditer(ql):
+        kind = m.lastgroup
+        if kind == "bed":
+            f.setdefault("bedrooms", m.group("bed_n"))
+        elif kind in ("under", "over"):
+            val = float(m.group(kind + "_n").replace(",", "")); unit = m.group(kind + "_u") or ""
+            key = "max_price" if kind == "under" else "min_price"
+            f.setdefault(key, val * (1_000_000 if unit == "m" else 1_000 if unit == "k" else 1))
+        else:
+            f.setdefault("min_area" if kind == "amin" else "max_area", float(m.group(kind + "_n").replace(",", "")))
     # exact area if user typed only a plain number like "180"
-    m_all = re.findall(r"\b(\d{2,4})\b", ql)
-    if m_all and "bedrooms" not in f and "min_price" not in f and "max_price" not in f:
+    m_all = _RE_PLAIN_NUM.findall(ql)
+    if m_all and not f.keys() & {"bedrooms", "min_price", "max_price", "min_area", "max_area"}:
         f["exact_area"] = float(m_all[0])
     # building like C1, A2
-    m = re.search(r"\b([a-z]\d{1,2})\b", ql, re.IGNORECASE)
+    m = _RE_BUILDING.search(ql)
     if m: f["building"] = m.group(1).upper()
     # exact unit like C1-002
-    m = re.search(r"\b([a-z]\d{1,2}-\d{2,3})\b", ql, re.IGNORECASE)
+    m = _RE_UNIT.search(ql)
     if m: f["unit_no"] = m.group(1).upper()
     return f
 
+def range_mask(prices: np.ndarray, areas: np.ndarray, lo_p: float, hi_p: float, lo_a: float, hi_a: float) -> np.ndarray:
+    """Inclusive price/area bounds; unbounded sides are +/-inf."""
+    return (prices >= lo_p) & (prices <= hi_p) & (areas >= lo_a) & (areas <= hi_a)
+
+def drop_unknown_codes(df: pd.DataFrame, f: dict) -> tuple:
+    """Split out building/unit codes that don't exist in `df`, so a typo doesn't filter everything away."""
+    unknown = {k: f[k] for k, col in (("building", "_building_upper"), ("unit_no", "_unit_upper"))
+               if k in f and f[k] not in df[col].cat.categories}
+    if not unknown:
+        return f, unknown
+    return {k: v for k, v in f.items() if k not in unknown}, unknown
+
+def prefilter(df: pd.DataFrame, projects, statuses) -> pd.DataFrame:
+    """Project/status cut, applied first: a cheap category-code isin that usually removes most rows."""
+    mask = np.ones(len(df), dtype=bool)
+    if projects: mask &= df["project"].isin(projects).to_numpy()
+    if statuses: mask &= df["status"].isin(statuses).to_numpy()
+    return df if mask.all() else df[mask]
+
 def apply_filters(df: pd.DataFrame, f: dict) -> pd.DataFrame:
-    out = df.copy()
-    if "project" in f: out = out[out["project"].isin(f["project"])]
-    if "status" in f: out = out[out["status"].isin(f["status"])]
+    df = prefilter(df, f.get("project"), f.get("status"))
+    # Fuse the remaining predicates into one NumPy mask over the smaller frame and index it once
+    mask = np.ones(len(df), dtype=bool)
     if "bedrooms" in f:
-        regex = rf"(^|\s){re.escape(f['bedrooms'])}\s*Bedrooms?"
-        out = out[out["configuration"].fillna("").str.contains(regex, case=False, regex=True)]
-    if "min_price" in f: out = out[out["price"].fillna(0) >= f["min_price"]]
-    if "max_price" in f: out = out[out["price"].fillna(0) <= f["max_price"]]
-    if "min_area" in f: out = out[out["selling_area"].fillna(0) >= f["min_area"]]
-    if "max_area" in f: out = out[out["selling_area"].fillna(0) <= f["max_area"]]
-    if "exact_area" in f: out = out[out["selling_area"].fillna(0) == f["exact_area"]]
-    if "building" in f: out = out[out["_building_upper"] == f["building"]]
-    if "unit_no" in f: out = out[out["_unit_upper"] == f["unit_no"]]
-    return out
+        mask &= (df["_bedrooms"] == int(f["bedrooms"])).to_numpy(dtype=bool, na_value=False)
+    lo_p, hi_p = f.get("min_price", -np.inf), f.get("max_price", np.inf)
+    lo_a, hi_a = f.get("min_area", -np.inf), f.get("max_area", np.inf)
+    if "exact_area" in f: lo_a, hi_a = max(lo_a, f["exact_area"]), min(hi_a, f["exact_area"])
+    if np.isfinite([lo_p, hi_p, lo_a, hi_a]).any():
+        mask &= range_mask(df["_price_f"].to_numpy(), df["_area_f"].to_numpy(), lo_p, hi_p, lo_a, hi_a)
+    if "building" in f: mask &= (df["_building_upper"] == f["building"]).to_numpy()
+    if "unit_no" in f: mask &= (df["_unit_upper"] == f["unit_no"]).to_numpy()
+    return df if mask.all() else df[mask]  # no copy when nothing was filtered out
+
+@st.cache_data(ttl=REFRESH_SECONDS, max_entries=64, show_spinner=False)
+def _to_csv_bytes(_df: pd.DataFrame, fingerprint: tuple) -> bytes:
+    """CSV export of the visible columns; cached on `fingerprint` so reruns with unchanged results skip serialization."""
+    visible = _df.drop(columns=[c for c in _df.columns if c.startswith("_")], errors="ignore")
+    buf = io.BytesIO()
+    if pa is not None:
+        # Mixed-type object columns (e.g. row_no from two differently parsed sheets) go in as strings
+        visible = visible.astype({c: "string" for c in visible.select_dtypes(include=["object"]).columns})
+        try:
+            table = pa.Table.from_pandas(visible, preserve_index=False)
+        except pa.ArrowException:
+            table = None
+        if table is not None:
+            pac.write_csv(table, buf)
+            return buf.getvalue()
+    visible.to_csv(buf, index=False, encoding="utf-8")
+    return buf.getvalue()
 
 # ====== In-app media mapping (web URLs) ======
 # Put web-accessible URLs here (YouTube, Google Drive preview links, S3, company CDN...)
@@ -223,8 +333,8 @@ if units.empty:
 
 # Sidebar filters
 st.sidebar.header("Quick Filters")
-project = st.sidebar.multiselect("Project", sorted(units["project"].dropna().unique().tolist()))
-status = st.sidebar.multiselect("Status", sorted(units["status"].dropna().unique().tolist()))
+project = st.sidebar.multiselect("Project", units["project"].cat.categories.tolist())
+status = st.sidebar.multiselect("Status", units["status"].cat.categories.tolist())
 bedrooms = st.sidebar.text_input("Bedrooms (e.g., 2, 3, 4)")
 
 min_price = st.sidebar.text_input("Min Price (e.g., 5m, 7500000)")
@@ -233,21 +343,21 @@ min_area = st.sidebar.text_input("Min Area (e.g., 90)")
 max_area = st.sidebar.text_input("Max Area (e.g., 200)")
 
 def filter_df(df):
-    out = df.copy()
-    if project: out = out[out["project"].isin(project)]
-    if status: out = out[out["status"].isin(status)]
+    df = prefilter(df, project, status)
+    mask = np.ones(len(df), dtype=bool)
     if bedrooms:
-        nums = [n.strip() for n in bedrooms.split(",") if n.strip()]
+        nums = tuple(int(n) for n in (n.strip() for n in bedrooms.split(",")) if n.isdecimal())
         if nums:
-            regex = r"(^|\s)(" + "|".join([re.escape(n) for n in nums]) + r")\s*Bedrooms?"
-            out = out[out["configuration"].fillna("").str.contains(regex, case=False, regex=True)]
+            mask &= df["_bedrooms"].isin(nums).to_numpy(dtype=bool, na_value=False)
     lo_p, hi_p = parse_number(min_price), parse_number(max_price)
     lo_a, hi_a = parse_number(min_area), parse_number(max_area)
-    if lo_p is not None: out = out[out["price"].fillna(0) >= lo_p]
-    if hi_p is not None: out = out[out["price"].fillna(0) <= hi_p]
-    if lo_a is not None: out = out[out["selling_area"].fillna(0) >= lo_a]
-    if hi_a is not None: out = out[out["selling_area"].fillna(0) <= hi_a]
-    return out
+    if any(v is not None for v in (lo_p, hi_p, lo_a, hi_a)):
+        mask &= range_mask(
+            df["_price_f"].to_numpy(), df["_area_f"].to_numpy(),
+            -np.inf if lo_p is None else lo_p, np.inf if hi_p is None else hi_p,
+            -np.inf if lo_a is None else lo_a, np.inf if hi_a is None else hi_a,
+        )
+    return df if mask.all() else df[mask]  # no copy when nothing was filtered out
 
 filtered = filter_df(units)
 
@@ -255,21 +365,26 @@ filtered = filter_df(units)
 st.subheader("Chat")
 prompt = st.text_input("e.g., 'Available BOHO 2 bedrooms under 12m', 'Boardwalk C1-002', 'C1 180'")
 
+parsed, unknown = drop_unknown_codes(units, parse_query(prompt)) if prompt else ({}, {})
+for key, code in unknown.items():
+    what = "building" if key == "building" else "unit"
+    st.warning(f"No {what} {code} in the sheets; ignoring it in the query.", icon="⚠️")
 chat_df = filtered
 if prompt:
-    f = parse_query(prompt)
-    chat_df = apply_filters(filtered, f)
+    chat_df = apply_filters(filtered, parsed)
 
 st.write(f"**Matches:** {len(chat_df)}")
-st.dataframe(chat_df, use_container_width=True)
+st.dataframe(chat_df, use_container_width=True, column_order=[c for c in chat_df.columns if not c.startswith("_")])
 
 # Unit selection
-unit_choices = chat_df["unit_no"].dropna().unique().tolist()
-sel = st.selectbox("Choose a unit to preview PDF & video:", ["--"] + unit_choices, index=0)
+uniq = chat_df["unit_no"].dropna().unique()
+sel = st.selectbox("Choose a unit to preview PDF & video:", ["--"] + uniq[:MAX_UNIT_CHOICES].tolist(), index=0)
+if len(uniq) > MAX_UNIT_CHOICES:
+    st.caption(f"Showing the first {MAX_UNIT_CHOICES} of {len(uniq)} units; narrow the search or type a unit number to see others.")
 
 # If the chat produced exactly one unit, auto-select it
-if prompt and "unit_no" in parse_query(prompt) and len(unit_choices) == 1:
-    sel = unit_choices[0]
+if prompt and "unit_no" in parsed and len(uniq) == 1:
+    sel = uniq[0]
 
 if sel and sel != "--":
     row = chat_df[chat_df["_unit_upper"] == str(sel).upper()]
@@ -297,5 +412,5 @@ if sel and sel != "--":
             st.warning("No PDF/Video registered for this unit in MEDIA_MAP. Edit MEDIA_MAP in the code to add links.", icon="⚠️")
 
 # Download results
-csv = chat_df.drop(columns=[c for c in chat_df.columns if c.startswith("_")], errors="ignore").to_csv(index=False).encode("utf-8")
+csv = _to_csv_bytes(chat_df, (len(chat_df), int(pd.util.hash_pandas_object(chat_df).sum())))
 st.download_button("⬇️ Download results as CSV", data=csv, file_name="filtered_units.csv")